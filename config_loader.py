@@ -7,17 +7,23 @@
 优先级：环境变量 > config.toml > 默认值
 """
 
+import functools
 import os
+import sys
 import tomllib
 from typing import TypedDict
 
-DEFAULT_TARGET_EMOJIS: list[str] = [
+# 表情字符串均经 sys.intern，与抓取时驻留的 reaction_details 键为同一对象，集合查找按指针即可命中
+DEFAULT_TARGET_EMOJIS: list[str] = [sys.intern(e) for e in (
     '❤️', '👍', '🤍', '💜', '💙', '💚', '💛', '🧡', '🖤', '🤎',
     '❤', '♥', '💕', '💞', '💓', '💗', '💖', '💘', '💝', '👍🏻',
     '👍🏼', '👍🏽', '👍🏾', '👍🏿', '🙏', '🔥', '💯', '❣️', '♥️'
-]
+)]
 
-ALL_EMOJIS: list[str] = [
+# 供逐条消息做成员判断的集合形式，避免调用方重复构建
+DEFAULT_TARGET_EMOJIS_SET: frozenset[str] = frozenset(DEFAULT_TARGET_EMOJIS)
+
+ALL_EMOJIS: list[str] = [sys.intern(e) for e in (
     # 爱心系列
     '❤️', '🤍', '💜', '💙', '💚', '💛', '🧡', '🖤', '🤎',
     '❤', '♥', '💕', '💞', '💓', '💗', '💖', '💘', '💝', '❣️', '♥️',
@@ -30,7 +36,9 @@ ALL_EMOJIS: list[str] = [
     '💩', '🤡', '🥱', '🥴', '😈', '🤮', '💊',
     '🏆', '⚡', '🍌', '🖕', '👀', '🌚', '🐳',
     '❤️‍🔥', '🆒', '👻', '🎃', '🕊', '🤝', '✍️',
-]
+)]
+
+ALL_EMOJIS_SET: frozenset[str] = frozenset(ALL_EMOJIS)
 
 
 class TelegramConfig(TypedDict):
@@ -52,33 +60,17 @@ _CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
 _CONFIG_PATH = os.path.join(_CONFIG_DIR, 'config.toml')
 
 
-def load_config() -> TelegramConfig:
+@functools.lru_cache(maxsize=4)
+def _parse_toml(path: str, mtime_ns: int | None) -> dict:
     """
-    加载并合并全部配置项。
-
-    从 ``config.toml`` 读取基础配置，再用同名环境变量覆盖。
-    若 TOML 文件不存在则静默回退到环境变量与默认值。
-
-    返回
-    ----
-    dict
-        包含以下键的字典：
+    解析 TOML 文件并展开为与 ``load_config`` 返回值同名的扁平字典（尚未应用环境变量）。
 
-        - ``api_id`` : int 或 None
-        - ``api_hash`` : str 或 None
-        - ``session_name`` : str — 绝对路径
-        - ``proxy`` : tuple 或 None — Telethon 代理三元组
-        - ``phone`` : str
-        - ``code`` : str
-        - ``password`` : str
-        - ``channel`` : str
-        - ``start_date`` : str
-        - ``end_date`` : str
+    以路径和修改时间为缓存键，文件变更后自动重新解析；mtime_ns 为 None 表示文件不存在，
+    此时全部取默认值。结果被多次调用共享，其中的序列均为不可变的 tuple。
     """
-    # 读取 TOML 文件（不存在则用空字典）
     toml_cfg = {}
-    if os.path.exists(_CONFIG_PATH):
-        with open(_CONFIG_PATH, 'rb') as f:
+    if mtime_ns is not None:
+        with open(path, 'rb') as f:
             toml_cfg = tomllib.load(f)
 
     tg = toml_cfg.get('telegram', {})
@@ -86,16 +78,6 @@ def load_config() -> TelegramConfig:
     auth = toml_cfg.get('auth', {})
     analyzer = toml_cfg.get('analyzer', {})
 
-    # --- telegram ---
-    api_id_raw = os.getenv('TELEGRAM_API_ID') or tg.get('api_id')
-    api_id = int(api_id_raw) if api_id_raw is not None else None
-
-    api_hash = os.getenv('TELEGRAM_API_HASH') or tg.get('api_hash')
-    bot_token = os.getenv('TELEGRAM_BOT_TOKEN') or tg.get('bot_token', '')
-
-    session_rel = tg.get('session_name', 'telegram_session')
-    session_name = os.path.normpath(os.path.join(_CONFIG_DIR, session_rel))
-
     # --- proxy ---
     proxy = None
     if proxy_cfg.get('enabled', False):
@@ -113,36 +95,88 @@ def load_config() -> TelegramConfig:
             proxy_cfg.get('port', 7890),
         )
 
-    # --- auth ---
-    phone = os.getenv('TELEGRAM_PHONE') or auth.get('phone', '')
-    code = os.getenv('TELEGRAM_CODE') or auth.get('code', '')
-    password = os.getenv('TELEGRAM_PASSWORD') or auth.get('password', '')
+    session_rel = tg.get('session_name', 'telegram_session')
+
+    return {
+        'api_id': tg.get('api_id'),
+        'api_hash': tg.get('api_hash'),
+        'session_name': os.path.normpath(os.path.join(_CONFIG_DIR, session_rel)),
+        'proxy': proxy,
+        'phone': auth.get('phone', ''),
+        'code': auth.get('code', ''),
+        'password': auth.get('password', ''),
+        'channel': analyzer.get('channel', ''),
+        'start_date': analyzer.get('start_date', ''),
+        'end_date': analyzer.get('end_date', ''),
+        'target_emojis': tuple(map(sys.intern, analyzer.get('target_emojis') or DEFAULT_TARGET_EMOJIS)),
+        'bot_token': tg.get('bot_token', ''),
+    }
 
-    # --- analyzer ---
-    channel = os.getenv('TELEGRAM_CHANNEL') or analyzer.get('channel', '')
-    start_date = os.getenv('START_DATE') or analyzer.get('start_date', '')
-    end_date = os.getenv('END_DATE') or analyzer.get('end_date', '')
 
-    # --- target_emojis ---
-    target_emojis_env = os.getenv('TARGET_EMOJIS')
+@functools.lru_cache(maxsize=32)
+def _parse_emoji_list(raw: str) -> tuple[str, ...]:
+    """解析逗号分隔的表情列表；按原始字符串缓存，Streamlit 每次 rerun 无需重新拆分。"""
+    return tuple(sys.intern(e) for e in map(str.strip, raw.split(',')) if e)
+
+
+def _read_toml() -> dict:
+    """读取 config.toml 的扁平配置（文件不存在时为默认值），未变更时复用上次的解析结果。"""
+    try:
+        mtime_ns = os.stat(_CONFIG_PATH).st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+    return _parse_toml(_CONFIG_PATH, mtime_ns)
+
+
+def load_config() -> TelegramConfig:
+    """
+    加载并合并全部配置项。
+
+    从 ``config.toml`` 读取基础配置，再用同名环境变量覆盖。
+    若 TOML 文件不存在则静默回退到环境变量与默认值。
+    TOML 按文件修改时间缓存为扁平字典，每次调用只需读取环境变量并合并。
+
+    返回
+    ----
+    dict
+        包含以下键的字典：
+
+        - ``api_id`` : int 或 None
+        - ``api_hash`` : str 或 None
+        - ``session_name`` : str — 绝对路径
+        - ``proxy`` : tuple 或 None — Telethon 代理三元组
+        - ``phone`` : str
+        - ``code`` : str
+        - ``password`` : str
+        - ``channel`` : str
+        - ``start_date`` : str
+        - ``end_date`` : str
+    """
+    toml_cfg = _read_toml()
+    # 绑定到局部变量，各键直接走 environ.get，省去每次 os.getenv 的额外函数调用
+    env = os.environ
+
+    api_id_raw = env.get('TELEGRAM_API_ID') or toml_cfg['api_id']
+    api_id = int(api_id_raw) if api_id_raw is not None else None
+
+    target_emojis_env = env.get('TARGET_EMOJIS')
     if target_emojis_env:
-        target_emojis = [e.strip() for e in target_emojis_env.split(',') if e.strip()]
-    elif analyzer.get('target_emojis'):
-        target_emojis = list(analyzer['target_emojis'])
+        target_emojis = list(_parse_emoji_list(target_emojis_env))
     else:
-        target_emojis = list(DEFAULT_TARGET_EMOJIS)
+        # 返回新列表，调用方修改不会影响缓存
+        target_emojis = list(toml_cfg['target_emojis'])
 
     return {
         'api_id': api_id,
-        'api_hash': api_hash,
-        'session_name': session_name,
-        'proxy': proxy,
-        'phone': phone,
-        'code': code,
-        'password': password,
-        'channel': channel,
-        'start_date': start_date,
-        'end_date': end_date,
+        'api_hash': env.get('TELEGRAM_API_HASH') or toml_cfg['api_hash'],
+        'session_name': toml_cfg['session_name'],
+        'proxy': toml_cfg['proxy'],
+        'phone': env.get('TELEGRAM_PHONE') or toml_cfg['phone'],
+        'code': env.get('TELEGRAM_CODE') or toml_cfg['code'],
+        'password': env.get('TELEGRAM_PASSWORD') or toml_cfg['password'],
+        'channel': env.get('TELEGRAM_CHANNEL') or toml_cfg['channel'],
+        'start_date': env.get('START_DATE') or toml_cfg['start_date'],
+        'end_date': env.get('END_DATE') or toml_cfg['end_date'],
         'target_emojis': target_emojis,
-        'bot_token': bot_token,
+        'bot_token': env.get('TELEGRAM_BOT_TOKEN') or toml_cfg['bot_token'],
     }
@@ -5,34 +5,45 @@ Telegram 频道表情统计分析 - Streamlit Web 界面。
 提供可视化的频道选择、表情统计分析、排行榜展示与报告导出功能。
 """
 
+from __future__ import annotations
+
 import asyncio
+import atexit
+import contextlib
+import heapq
 import html
 import json
 import os
 import shutil
 import threading
-from collections.abc import Coroutine
+from collections.abc import Callable, Coroutine
 from datetime import datetime
-from typing import Any
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any
 
 import streamlit as st
-from telethon import TelegramClient
 
 from analyzer_core import (
-    calc_hotness,
+    assign_hotness,
+    atomic_open,
+    clear_raw_cache,
+    download_photo,
+    download_photo_ref,
+    dump_json,
+    fetch_channel_messages,
     filter_by_date_range,
     get_image_dir,
     get_image_path,
-    get_raw_cache_path,
+    load_image_index,
+    load_json,
     load_raw_cache,
     refilter_reactions,
     save_raw_cache,
 )
 from config_loader import ALL_EMOJIS, DEFAULT_TARGET_EMOJIS, load_config
 
-# 独立线程事件循环，替代 nest-asyncio
-_loop = asyncio.new_event_loop()
-threading.Thread(target=_loop.run_forever, daemon=True).start()
+if TYPE_CHECKING:
+    from telethon import TelegramClient
 
 # ==================== 配置区域 ====================
 _cfg = load_config()
@@ -41,16 +52,77 @@ API_HASH = _cfg['api_hash']
 SESSION_NAME = _cfg['session_name']
 PROXY = _cfg['proxy']
 
+# 下载配图时同时在途的请求数上限
+MAX_CONCURRENT_DOWNLOADS = 8
+# 分析阶段同步下载配图的前几名，其余在后台继续下载，不阻塞结果展示
+EAGER_IMAGE_DOWNLOADS = 10
+
 # =================================================
 
 
+@st.cache_resource
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取运行在独立线程中的事件循环（替代 nest-asyncio）。
+
+    Streamlit 每次 rerun 都会重新执行脚本，借助 ``st.cache_resource``
+    保证整个进程只创建一个事件循环及其线程。
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+@st.cache_resource
+def get_client() -> TelegramClient:
+    """
+    获取进程内共享的 Telegram 客户端。
+
+    客户端跨 rerun 与会话复用，首次 ``check_connection`` 时在后台事件循环上
+    建立连接并保持，避免每次操作都重新握手。
+    telethon 在此处才导入，仅浏览缓存结果时无需加载。
+    """
+    from telethon import TelegramClient
+
+    # 界面只主动发起请求，不监听更新
+    client = TelegramClient(SESSION_NAME, API_ID, API_HASH, proxy=PROXY, receive_updates=False)
+    # 退出钩子运行时已不在任何脚本执行中，不应再调用 st.cache_resource 函数，提前取好事件循环
+    loop = _get_event_loop()
+
+    def disconnect() -> None:
+        # 进程退出时在后台事件循环上正常断开，确保 session 文件写回；
+        # 断开缓慢或失败时放弃等待，不向退出流程抛出异常
+        if client.is_connected():
+            with contextlib.suppress(Exception):
+                asyncio.run_coroutine_threadsafe(client.disconnect(), loop).result(timeout=5)
+
+    atexit.register(disconnect)
+    return client
+
+
+@st.cache_resource
+def _get_entity_cache() -> dict[int, Any]:
+    """
+    获取进程内共享的频道实体缓存（频道 ID → 已解析的实体）。
+
+    脚本每次 rerun 都会重新执行，模块级字典无法跨 rerun 保留，
+    因此同样交由 ``st.cache_resource`` 持有。
+    """
+    return {}
+
+
+@st.cache_resource
+def _get_image_tasks() -> dict[int, asyncio.Task[None]]:
+    """获取进程内共享的后台配图下载任务（频道 ID → 运行在后台事件循环上的任务）。"""
+    return {}
+
+
 def run_async(coro: Coroutine[Any, Any, Any]) -> Any:
     """在同步上下文中运行异步协程（通过独立线程的事件循环）。"""
-    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    future = asyncio.run_coroutine_threadsafe(coro, _get_event_loop())
     return future.result()
 
 
-
 def get_cache_path(channel_id: int) -> str:
     """
     获取分析结果缓存文件路径。
@@ -90,14 +162,15 @@ def load_cache(channel_id: int) -> tuple[list[dict[str, Any]] | None, str | None
     if not os.path.exists(path):
         return None, None
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(path, 'rb') as f:
+            data = load_json(f.read())
         results = data['results']
-        # 验证 image_path 是否仍然存在
+        # 验证 image_path 是否仍然存在：整个图片目录只扫描一次，而非逐条 stat；
+        # 写缓存时尚在后台下载的配图也在此补上
+        images = load_image_index(channel_id)
         for msg in results:
-            img = msg.get('image_path')
-            if img and not os.path.exists(img):
-                msg['image_path'] = None
+            if msg.get('image_path') or msg.get('has_photo'):
+                msg['image_path'] = images.get(msg['id'])
         return results, data['analyzed_at']
     except (json.JSONDecodeError, KeyError):
         return None, None
@@ -123,8 +196,8 @@ def save_cache(channel_id: int, channel_title: str, results: list[dict[str, Any]
         'analyzed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'results': results,
     }
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with atomic_open(path) as f:
+        f.write(dump_json(data))
 
 
 
@@ -160,14 +233,57 @@ def clear_all_cache(channel_id: int) -> None:
         频道 ID。
     """
     clear_result_cache(channel_id)
-    raw_path = get_raw_cache_path(channel_id)
-    if os.path.exists(raw_path):
-        os.remove(raw_path)
+    clear_raw_cache(channel_id)
 
 
-async def check_connection() -> tuple[bool, str | None]:
+async def ensure_authorized(client: TelegramClient) -> bool:
     """
-    检查当前 session 是否已登录授权。
+    确保共享客户端已连接并返回当前 session 是否已授权。
+
+    共享客户端长期存活，网络中断且自动重连失败后会处于断开状态，
+    每次操作前按需重新连接即可继续使用。
+    """
+    if not client.is_connected():
+        await client.connect()
+    return await client.is_user_authorized()
+
+
+async def resolve_channel(client: TelegramClient, channel: dict[str, Any]) -> Any:
+    """
+    解析频道实体，同一频道只向 Telegram 请求一次。
+
+    抓取与下载图片两个阶段共用解析结果，省去重复的 ``resolveUsername`` 请求；
+    解析后写回 session 文件，重启后也能直接使用其中的 access_hash。
+
+    参数
+    ----
+    client : TelegramClient
+        已连接的共享 Telegram 客户端。
+    channel : dict
+        频道信息，包含 ``id``, ``title``, ``username``。
+
+    返回
+    ----
+    telethon.tl.types.Channel
+        频道实体。
+    """
+    cache = _get_entity_cache()
+    entity = cache.get(channel['id'])
+    if entity is None:
+        entity = await client.get_entity(channel['username'] or channel['id'])
+        client.session.save()
+        cache[channel['id']] = entity
+    return entity
+
+
+async def check_connection(client: TelegramClient) -> tuple[bool, str | None]:
+    """
+    建立连接并检查当前 session 是否已登录授权。
+
+    参数
+    ----
+    client : TelegramClient
+        共享的 Telegram 客户端，未连接时自动连接。
 
     返回
     ----
@@ -175,31 +291,30 @@ async def check_connection() -> tuple[bool, str | None]:
         ``(authorized, error)``；连接异常时 ``authorized`` 为 False，
         ``error`` 为错误信息。
     """
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH, proxy=PROXY)
     try:
-        await client.connect()
-        authorized = await client.is_user_authorized()
-        await client.disconnect()
+        authorized = await ensure_authorized(client)
         return authorized, None
     except Exception as e:
         return False, str(e)
 
 
-async def fetch_channels() -> tuple[list[dict[str, Any]], str | None]:
+async def fetch_channels(client: TelegramClient) -> tuple[list[dict[str, Any]], str | None]:
     """
     获取用户已加入的所有频道。
 
+    参数
+    ----
+    client : TelegramClient
+        共享的 Telegram 客户端，未连接时自动连接。
+
     返回
     ----
     tuple[list[dict], str | None]
         ``(channels, error)``；每个频道为包含
         ``id``, ``title``, ``username`` 的字典。
     """
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH, proxy=PROXY)
     try:
-        await client.connect()
-        if not await client.is_user_authorized():
-            await client.disconnect()
+        if not await ensure_authorized(client):
             return [], "未授权"
 
         channels = []
@@ -211,108 +326,133 @@ async def fetch_channels() -> tuple[list[dict[str, Any]], str | None]:
                     'title': entity.title,
                     'username': getattr(entity, 'username', None),
                 })
-        await client.disconnect()
         return channels, None
     except Exception as e:
         return [], str(e)
 
 
-async def fetch_messages_async(channel: dict[str, Any], progress_bar: Any, status_text: Any) -> tuple[list[dict[str, Any]] | None, int | None, str | None]:
+async def fetch_messages_async(client: TelegramClient, channel: dict[str, Any], progress_bar: Any, status_text: Any, resume: bool = True) -> tuple[list[dict[str, Any]] | None, int | None, str | None]:
     """
     从 Telegram 获取频道的原始消息数据。
 
-    遍历频道全部消息，提取含有表情反应的消息及其统计信息。
+    通过 ``fetch_channel_messages`` 遍历频道全部消息，提取含有表情反应的消息及其统计信息。
     此为分析流程的第一阶段，返回未排序、无图片的原始数据。
 
     参数
     ----
+    client : TelegramClient
+        共享的 Telegram 客户端，未连接时自动连接。
     channel : dict
         频道信息，包含 ``id``, ``title``, ``username``。
     progress_bar : streamlit.delta_generator.DeltaGenerator
         Streamlit 进度条组件。
     status_text : streamlit.delta_generator.DeltaGenerator
         Streamlit 状态文本组件。
+    resume : bool
+        是否从上次中断的抓取日志继续。
 
     返回
     ----
     tuple[list[dict] | None, int | None, str | None]
         ``(messages, total_checked, error)``。
     """
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH, proxy=PROXY)
     try:
-        await client.connect()
-        if not await client.is_user_authorized():
-            await client.disconnect()
+        if not await ensure_authorized(client):
             return None, None, "未授权"
 
-        if channel['username']:
-            entity = await client.get_entity(channel['username'])
-        else:
-            entity = await client.get_entity(channel['id'])
-
-        messages_with_reactions = []
-        total_checked = 0
+        entity = await resolve_channel(client, channel)
 
         status_text.text("正在获取消息...")
 
-        async for message in client.iter_messages(entity, limit=None):
-            total_checked += 1
-
-            reaction_details: dict[str, int] = {}
-            if message.reactions:
-                for reaction in message.reactions.results:
-                    if hasattr(reaction.reaction, 'emoticon'):
-                        emoji = reaction.reaction.emoticon
-                        reaction_details[emoji] = reaction.count
+        async def on_progress(percent: int) -> None:
+            status_text.text(f"正在获取消息... {percent}%")
+            progress_bar.progress(min(percent / 100, 0.99))
 
-            if reaction_details or message.reactions:
-                if hasattr(entity, 'username') and entity.username:
-                    msg_link = f"https://t.me/{entity.username}/{message.id}"
-                else:
-                    msg_link = f"https://t.me/c/{entity.id}/{message.id}"
-
-                target_emojis = st.session_state.get('target_emojis', DEFAULT_TARGET_EMOJIS)
-                reaction_count = sum(reaction_details.get(e, 0) for e in target_emojis)
-
-                messages_with_reactions.append({
-                    'id': message.id,
-                    'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                    'text': message.text[:100] + '...' if message.text and len(message.text) > 100 else (message.text or '[无文字内容]'),
-                    'views': message.views or 0,
-                    'forwards': message.forwards or 0,
-                    'reactions': reaction_count,
-                    'reaction_details': reaction_details,
-                    'total_reactions': sum(r.count for r in message.reactions.results) if message.reactions else 0,
-                    'link': msg_link,
-                    'has_photo': bool(message.photo),
-                    'image_path': None,
-                })
-
-            if total_checked % 50 == 0:
-                status_text.text(f"已检查 {total_checked} 条消息...")
-                progress_bar.progress(min(total_checked / 10000, 0.99))
+        messages_with_reactions, total_checked = await fetch_channel_messages(
+            client,
+            entity,
+            st.session_state.get('target_emojis', DEFAULT_TARGET_EMOJIS),
+            on_progress=on_progress,
+            resume=resume,
+        )
 
         progress_bar.progress(1.0)
         status_text.text(f"完成！共检查 {total_checked} 条消息")
-
-        await client.disconnect()
         return messages_with_reactions, total_checked, None
     except Exception as e:
+        return None, None, f"获取频道失败: {e}"
+
+
+async def download_images(client: TelegramClient, channel: dict[str, Any], pending: list[dict[str, Any]], on_done: Callable[[], None] | None = None) -> None:
+    """
+    并发下载消息配图，成功后写入各消息的 ``image_path``。
+
+    优先用抓取阶段保存的 ``photo_ref`` 直接下载；没有 ``photo_ref``（旧缓存）
+    或其 file_reference 已过期的消息，合并为一次请求重新获取后再下载。
+
+    参数
+    ----
+    client : TelegramClient
+        已授权的共享 Telegram 客户端。
+    channel : dict
+        频道信息，包含 ``id``, ``title``, ``username``。
+    pending : list[dict]
+        需要下载配图的消息。
+    on_done : Callable[[], None] | None
+        每条消息处理完毕（无论成功与否）时调用，用于更新进度。
+    """
+    img_dir = get_image_dir(channel['id'])
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    # 没有 photo_ref（旧缓存）或 file_reference 已过期，需要重新获取消息的条目
+    stale: list[dict[str, Any]] = [msg for msg in pending if not msg.get('photo_ref')]
+
+    def advance() -> None:
+        if on_done:
+            on_done()
+
+    async def download_by_ref(msg: dict[str, Any]) -> None:
+        async with semaphore:
+            try:
+                msg['image_path'] = await download_photo_ref(client, msg['photo_ref'], os.path.join(img_dir, str(msg['id'])))
+            except Exception:
+                stale.append(msg)
+                return
+        advance()
+
+    async def download_by_message(msg: dict[str, Any], photo: Any) -> None:
+        if photo:
+            async with semaphore:
+                try:
+                    downloaded = await download_photo(client, photo, os.path.join(img_dir, str(msg['id'])))
+                    if downloaded:
+                        msg['image_path'] = downloaded
+                except Exception:
+                    pass
+        advance()
+
+    await asyncio.gather(*(download_by_ref(msg) for msg in pending if msg.get('photo_ref')))
+
+    if stale:
+        entity = await resolve_channel(client, channel)
+        # 一次请求取回剩余消息的图片对象，而非每张图单独请求
         try:
-            await client.disconnect()
+            tg_msgs = await client.get_messages(entity, ids=[msg['id'] for msg in stale])
+            photos = {tg_msg.id: tg_msg.photo for tg_msg in tg_msgs if tg_msg and tg_msg.photo}
         except Exception:
-            pass
-        return None, None, f"获取频道失败: {e}"
+            photos = {}
+        await asyncio.gather(*(download_by_message(msg, photos.get(msg['id'])) for msg in stale))
 
 
-async def process_results_async(channel: dict[str, Any], raw_messages: list[dict[str, Any]], progress_bar: Any, status_text: Any) -> tuple[list[dict[str, Any]] | None, str | None]:
+async def process_results_async(client: TelegramClient, channel: dict[str, Any], raw_messages: list[dict[str, Any]], progress_bar: Any, status_text: Any) -> tuple[list[dict[str, Any]] | None, str | None]:
     """
-    对原始消息排序并为前 50 名下载配图。
+    为原始消息计算热度，并为表情数前 50 名下载配图。
 
     此为分析流程的第二阶段。
 
     参数
     ----
+    client : TelegramClient
+        共享的 Telegram 客户端，仅在需要下载图片时使用，未连接时自动连接。
     channel : dict
         频道信息，包含 ``id``, ``title``, ``username``。
     raw_messages : list[dict]
@@ -328,15 +468,21 @@ async def process_results_async(channel: dict[str, Any], raw_messages: list[dict
         ``(results, error)``。
     """
     status_text.text("正在排序并下载图片...")
-    results = sorted(raw_messages, key=lambda x: x['reactions'], reverse=True)
+    results = assign_hotness(raw_messages)
 
     # 为每条消息确保有 image_path 字段
     for msg in results:
         if 'image_path' not in msg:
             msg['image_path'] = None
 
-    # 筛选需要下载图片的消息
-    to_download = [msg for msg in results[:50] if msg.get('has_photo')]
+    # 筛选需要下载图片的消息；展示时会按所选方式重新排序，这里只需选出前 50 名
+    top = heapq.nlargest(50, results, key=itemgetter('reactions'))
+    to_download = [msg for msg in top if msg.get('has_photo')]
+    # 上次分析留下的后台下载尚未结束时先等待，避免把写到一半的图片当作已下载
+    previous = _get_image_tasks().pop(channel['id'], None)
+    if previous and not previous.done():
+        await asyncio.wait([previous])
+
     # 检查已有缓存图片
     need_telegram = False
     for msg in to_download:
@@ -347,39 +493,33 @@ async def process_results_async(channel: dict[str, Any], raw_messages: list[dict
             need_telegram = True
 
     if need_telegram:
-        client = TelegramClient(SESSION_NAME, API_ID, API_HASH, proxy=PROXY)
         try:
-            await client.connect()
-            if not await client.is_user_authorized():
-                await client.disconnect()
+            if not await ensure_authorized(client):
                 return None, "未授权"
 
-            if channel['username']:
-                entity = await client.get_entity(channel['username'])
-            else:
-                entity = await client.get_entity(channel['id'])
+            pending = [msg for msg in to_download if not msg['image_path']]
+            # pending 按表情数降序，先下载排名靠前、打开页面即可见的图片
+            eager, lazy = pending[:EAGER_IMAGE_DOWNLOADS], pending[EAGER_IMAGE_DOWNLOADS:]
+            done = 0
 
-            for i, msg in enumerate(to_download):
-                if msg['image_path']:
-                    continue
-                img_dir = get_image_dir(channel['id'])
-                dest_path = os.path.join(img_dir, str(msg['id']))
-                try:
-                    tg_msg = await client.get_messages(entity, ids=msg['id'])
-                    if tg_msg and tg_msg.photo:
-                        downloaded = await client.download_media(tg_msg.photo, file=dest_path)
-                        if downloaded:
-                            msg['image_path'] = downloaded
-                except Exception:
-                    pass
-                progress_bar.progress(min((i + 1) / len(to_download), 0.99))
+            def advance() -> None:
+                nonlocal done
+                # 事件循环单线程执行，计数无需加锁
+                done += 1
+                progress_bar.progress(min(done / len(eager), 0.99))
+
+            await download_images(client, channel, eager, advance)
 
-            await client.disconnect()
+            if lazy:
+                async def download_rest() -> None:
+                    try:
+                        await download_images(client, channel, lazy)
+                    except Exception:
+                        pass
+
+                # 后台事件循环常驻，任务在本次 rerun 结束后继续运行；展示页轮询其完成状态
+                _get_image_tasks()[channel['id']] = asyncio.create_task(download_rest())
         except Exception as e:
-            try:
-                await client.disconnect()
-            except Exception:
-                pass
             return None, f"下载图片失败: {e}"
 
     progress_bar.progress(1.0)
@@ -403,43 +543,52 @@ def generate_report(messages: list[dict[str, Any]], channel_title: str) -> str:
     str
         完整的报告文本。
     """
-    lines = []
-    lines.append("Telegram 频道表情统计报告")
-    lines.append(f"频道: {channel_title}")
-    lines.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    lines.append("=" * 80)
-    lines.append("")
-
+    separator = "-" * 80
+    header = (
+        "Telegram 频道表情统计报告\n"
+        f"频道: {channel_title}\n"
+        f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"{'=' * 80}\n"
+    )
+    # 每条消息的整段文本由一个 f-string 生成，最后一次 join，避免逐行 append
+    parts = [header]
+    append = parts.append
     for idx, msg in enumerate(messages, 1):
-        lines.append(f"第 {idx} 名")
-        lines.append(f"时间: {msg['date']}")
-        lines.append(f"浏览: {msg['views']} | 转发: {msg['forwards']}")
-        lines.append(f"目标表情: {msg['reactions']} | 总表情: {msg['total_reactions']}")
-        lines.append(f"内容: {msg['text']}")
-        lines.append(f"链接: {msg['link']}")
-        lines.append("-" * 80)
+        append(
+            f"\n第 {idx} 名\n"
+            f"时间: {msg['date']}\n"
+            f"浏览: {msg['views']} | 转发: {msg['forwards']}\n"
+            f"目标表情: {msg['reactions']} | 总表情: {msg['total_reactions']}\n"
+            f"内容: {msg['text']}\n"
+            f"链接: {msg['link']}\n"
+            f"{separator}"
+        )
 
     total_target = sum(m['reactions'] for m in messages)
     total_all = sum(m['total_reactions'] for m in messages)
-    lines.append("")
-    lines.append("统计汇总:")
-    lines.append(f"有表情的消息数: {len(messages)}")
-    lines.append(f"目标表情总数: {total_target}")
-    lines.append(f"所有表情总数: {total_all}")
+    append(
+        "\n\n统计汇总:\n"
+        f"有表情的消息数: {len(messages)}\n"
+        f"目标表情总数: {total_target}\n"
+        f"所有表情总数: {total_all}"
+    )
     if total_all > 0:
-        lines.append(f"目标表情占比: {total_target/total_all*100:.1f}%")
+        append(f"\n目标表情占比: {total_target/total_all*100:.1f}%")
 
-    return "\n".join(lines)
+    return "".join(parts)
 
 
-async def send_report_to_saved(messages: list[dict[str, Any]], channel_title: str) -> tuple[bool, str | None]:
+async def send_report_to_saved(client: TelegramClient, messages: list[dict[str, Any]], channel_title: str) -> tuple[bool, str | None]:
     """
     将报告逐条发送到 Telegram 收藏夹。
 
-    每条消息间隔 1 秒以避免触发频率限制，支持附带配图。
+    不做固定间隔，由服务端 FloodWait 决定节奏：短等待由 Telethon 自动处理，
+    超过 ``flood_sleep_threshold`` 的等待在此休眠后重试。支持附带配图。
 
     参数
     ----
+    client : TelegramClient
+        共享的 Telegram 客户端，未连接时自动连接。
     messages : list[dict]
         排序后的消息列表。
     channel_title : str
@@ -450,11 +599,10 @@ async def send_report_to_saved(messages: list[dict[str, Any]], channel_title: st
     tuple[bool, str | None]
         ``(success, error)``。
     """
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH, proxy=PROXY)
+    from telethon.errors import FloodWaitError
+
     try:
-        await client.connect()
-        if not await client.is_user_authorized():
-            await client.disconnect()
+        if not await ensure_authorized(client):
             return False, "未授权"
 
         # 发送标题/汇总信息
@@ -469,7 +617,7 @@ async def send_report_to_saved(messages: list[dict[str, Any]], channel_title: st
         )
         await client.send_message('me', header)
 
-        # 逐条发送排行消息，每条间隔 1 秒避免触发 Telegram 频率限制
+        # 逐条发送排行消息
         for idx, msg in enumerate(messages, 1):
             text = (
                 f"第 {idx} 名\n"
@@ -481,20 +629,18 @@ async def send_report_to_saved(messages: list[dict[str, Any]], channel_title: st
             )
 
             image_path = msg.get('image_path')
-            if image_path and os.path.exists(image_path):
-                await client.send_file('me', file=image_path, caption=text[:1024])
-            else:
-                await client.send_message('me', text[:4000])
-
-            await asyncio.sleep(1)
+            while True:
+                try:
+                    if image_path and os.path.exists(image_path):
+                        await client.send_file('me', file=image_path, caption=text[:1024])
+                    else:
+                        await client.send_message('me', text[:4000])
+                    break
+                except FloodWaitError as e:
+                    await asyncio.sleep(e.seconds)
 
-        await client.disconnect()
         return True, None
     except Exception as e:
-        try:
-            await client.disconnect()
-        except Exception:
-            pass
         return False, str(e)
 
 
@@ -646,6 +792,40 @@ section[data-testid="stSidebar"] .stAlert {
 </style>
 """
 
+# 排行卡片模板：模块加载时拼接一次，渲染时只需一次 format 调用
+RANK_CARD_TEMPLATE = (
+    '<div class="rank-card">'
+    '<span class="{badge_cls}">第 {idx} 名</span>'
+    '<span style="color:#888; font-size:0.9em;">{date}</span>'
+    '<div style="margin:10px 0;">{text}</div>'
+    '<div>'
+    '{hotness_stat}'
+    '<span class="rank-stat primary">目标表情 {reactions}</span>'
+    '<span class="rank-stat">总表情 {total_reactions}</span>'
+    '<span class="rank-stat">浏览 {views:,}</span>'
+    '<span class="rank-stat">转发 {forwards:,}</span>'
+    '</div>'
+    '<div style="margin-top:8px;">'
+    '<a href="{link}" target="_blank" '
+    'style="color:#0088cc; text-decoration:none; font-size:0.9em;">'
+    '查看原文 &rarr;</a></div>'
+    '</div>'
+)
+
+
+@st.fragment(run_every=2)
+def _rerun_when_done(task: asyncio.Task[None]) -> None:
+    """
+    定时检查后台配图下载任务，完成后整页 rerun 以显示新下载的图片。
+
+    参数
+    ----
+    task : asyncio.Task
+        运行在后台事件循环上的下载任务。
+    """
+    if task.done():
+        st.rerun()
+
 
 def main() -> None:
     st.set_page_config(
@@ -684,13 +864,13 @@ def main() -> None:
 
         if not st.session_state.connected:
             with st.spinner("正在连接 Telegram..."):
-                authorized, error = run_async(check_connection())
+                authorized, error = run_async(check_connection(get_client()))
                 if error:
                     st.error(f"连接失败: {error}")
                 elif not authorized:
                     st.error("未授权，请先在命令行运行 telegram_channel_selector.py 完成登录")
                 else:
-                    channels, err = run_async(fetch_channels())
+                    channels, err = run_async(fetch_channels(get_client()))
                     if err:
                         st.error(f"获取频道失败: {err}")
                     else:
@@ -719,11 +899,11 @@ def main() -> None:
             if selected != st.session_state.target_emojis:
                 st.session_state.target_emojis = selected
                 if st.session_state.results is not None:
-                    refilter_reactions(st.session_state.results, selected)
+                    assign_hotness(refilter_reactions(st.session_state.results, selected))
             if st.button("恢复默认", width="stretch"):
                 st.session_state.target_emojis = list(DEFAULT_TARGET_EMOJIS)
                 if st.session_state.results is not None:
-                    refilter_reactions(st.session_state.results, DEFAULT_TARGET_EMOJIS)
+                    assign_hotness(refilter_reactions(st.session_state.results, DEFAULT_TARGET_EMOJIS))
                 st.rerun()
 
     # 主界面
@@ -789,11 +969,15 @@ def main() -> None:
         if st.button("开始分析", type="primary"):
             st.session_state.keyword = keyword
             channel_id = selected_channel['id']
-            cached_results, analyzed_at = load_cache(channel_id)
+            # 忽略缓存时不读取缓存文件，避免解析后直接丢弃
+            if force_reanalyze:
+                cached_results, analyzed_at = None, None
+            else:
+                cached_results, analyzed_at = load_cache(channel_id)
 
-            if cached_results is not None and not force_reanalyze:
+            if cached_results is not None:
                 # 层级1：有结果缓存且未忽略 → 直接使用
-                refilter_reactions(cached_results, st.session_state.target_emojis)
+                assign_hotness(refilter_reactions(cached_results, st.session_state.target_emojis))
                 st.session_state.results = cached_results
                 st.session_state.selected_channel = selected_channel
                 st.session_state.cache_time = analyzed_at
@@ -803,18 +987,24 @@ def main() -> None:
                 progress_bar = st.progress(0)
                 status_text = st.empty()
 
-                raw_messages, total_checked, raw_fetched_at = load_raw_cache(channel_id)
+                if force_reanalyze:
+                    raw_messages, total_checked, raw_fetched_at = None, None, None
+                else:
+                    raw_messages, total_checked, raw_fetched_at = load_raw_cache(channel_id)
 
-                if raw_messages is not None and not force_reanalyze:
+                if raw_messages is not None:
                     # 层级2：有原始数据缓存 → 跳过获取，直接排序+下载图片
                     status_text.text(f"使用原始数据缓存（{raw_fetched_at}），正在处理...")
+                    refilter_reactions(raw_messages, st.session_state.target_emojis)
                 else:
                     # 层级3：都没有 → 从 Telegram 获取
                     raw_messages, total_checked, fetch_error = run_async(
                         fetch_messages_async(
+                            get_client(),
                             selected_channel,
                             progress_bar,
-                            status_text
+                            status_text,
+                            resume=not force_reanalyze,
                         )
                     )
                     if fetch_error:
@@ -828,6 +1018,7 @@ def main() -> None:
                     progress_bar.progress(0)
                     results, proc_error = run_async(
                         process_results_async(
+                            get_client(),
                             selected_channel,
                             raw_messages,
                             progress_bar,
@@ -858,6 +1049,7 @@ def main() -> None:
     # 显示分析结果
     if st.session_state.results is not None:
         results = st.session_state.results
+        channel_id = st.session_state.selected_channel['id']
         channel_title = st.session_state.selected_channel['title']
 
         cache_info = ""
@@ -898,10 +1090,15 @@ def main() -> None:
 
             # 排序
             sort_method = st.session_state.get('sort_method', '目标表情数量')
-            if sort_method == '热度':
-                sorted_results = sorted(filtered, key=calc_hotness, reverse=True)
-            else:
-                sorted_results = sorted(filtered, key=lambda x: x['reactions'], reverse=True)
+            sort_key = itemgetter('hotness') if sort_method == '热度' else itemgetter('reactions')
+            # 页面只展示前 50 名，无需全量排序；完整排行仅在导出时才排序
+            top_results = heapq.nlargest(50, filtered, key=sort_key)
+
+            def full_ranking() -> list[dict[str, Any]]:
+                return sorted(filtered, key=sort_key, reverse=True)
+
+            def build_report() -> str:
+                return generate_report(full_ranking(), channel_title)
 
             # 统计汇总
             total_target = sum(m['reactions'] for m in filtered)
@@ -918,45 +1115,41 @@ def main() -> None:
             sort_label = "热度" if sort_method == "热度" else "目标表情数量"
             st.markdown(f"### 排行榜（按{sort_label}排序）")
 
-            for idx, msg in enumerate(sorted_results[:50], 1):
-                image_path = msg.get('image_path')
-                has_image = image_path and os.path.exists(image_path)
-
-                badge_cls = "rank-badge top3" if idx <= 3 else "rank-badge"
-                safe_text = html.escape(msg['text'] or '')
-                views_fmt = f"{msg['views']:,}"
-                forwards_fmt = f"{msg['forwards']:,}"
-
-                hotness_stat = f'<span class="rank-stat primary">🔥 热度 {calc_hotness(msg):.2f}</span>' if sort_method == '热度' else ''
-
-                card_html = (
-                    f'<div class="rank-card">'
-                    f'<span class="{badge_cls}">第 {idx} 名</span>'
-                    f'<span style="color:#888; font-size:0.9em;">{html.escape(msg["date"])}</span>'
-                    f'<div style="margin:10px 0;">{safe_text}</div>'
-                    f'<div>'
-                    f'{hotness_stat}'
-                    f'<span class="rank-stat primary">目标表情 {msg["reactions"]}</span>'
-                    f'<span class="rank-stat">总表情 {msg["total_reactions"]}</span>'
-                    f'<span class="rank-stat">浏览 {views_fmt}</span>'
-                    f'<span class="rank-stat">转发 {forwards_fmt}</span>'
-                    f'</div>'
-                    f'<div style="margin-top:8px;">'
-                    f'<a href="{msg["link"]}" target="_blank" '
-                    f'style="color:#0088cc; text-decoration:none; font-size:0.9em;">'
-                    f'查看原文 &rarr;</a></div>'
-                    f'</div>'
+            image_task = _get_image_tasks().get(channel_id)
+            images_loading = image_task is not None and not image_task.done()
+
+            for idx, msg in enumerate(top_results, 1):
+                image_path = msg.get('image_path') and get_image_path(channel_id, msg['id'])
+                has_image = bool(image_path)
+
+                card_html = RANK_CARD_TEMPLATE.format(
+                    badge_cls="rank-badge top3" if idx <= 3 else "rank-badge",
+                    idx=idx,
+                    date=html.escape(msg['date']),
+                    text=html.escape(msg['text'] or ''),
+                    hotness_stat=f'<span class="rank-stat primary">🔥 热度 {msg["hotness"]:.2f}</span>' if sort_method == '热度' else '',
+                    reactions=msg['reactions'],
+                    total_reactions=msg['total_reactions'],
+                    views=msg['views'],
+                    forwards=msg['forwards'],
+                    link=msg['link'],
                 )
 
-                if has_image:
+                if has_image or (images_loading and msg.get('has_photo')):
                     col_img, col_info = st.columns([1, 3])
                     with col_img:
-                        st.image(image_path, width="stretch")
+                        if has_image:
+                            st.image(image_path, width="stretch")
+                        else:
+                            st.caption("⏳ 图片加载中...")
                     with col_info:
                         st.markdown(card_html, unsafe_allow_html=True)
                 else:
                     st.markdown(card_html, unsafe_allow_html=True)
 
+            if images_loading:
+                _rerun_when_done(image_task)
+
             # 导出报告
             st.markdown("---")
             st.markdown("### 导出报告")
@@ -967,17 +1160,13 @@ def main() -> None:
                 horizontal=True,
             )
 
-            if send_scope == "前 50 条":
-                report_data = sorted_results[:50]
-            else:
-                report_data = sorted_results
-
             col_send, col_download = st.columns(2)
 
             with col_send:
                 if st.button("发送到 Telegram 收藏", width="stretch"):
+                    report_data = top_results if send_scope == "前 50 条" else full_ranking()
                     with st.spinner("正在发送到收藏夹..."):
-                        ok, err = run_async(send_report_to_saved(report_data, channel_title))
+                        ok, err = run_async(send_report_to_saved(get_client(), report_data, channel_title))
                         if ok:
                             st.success("已发送到 Telegram 收藏夹")
                         else:
@@ -986,7 +1175,8 @@ def main() -> None:
             with col_download:
                 st.download_button(
                     label="下载完整报告",
-                    data=generate_report(sorted_results, channel_title),
+                    # 传入无参函数，报告在点击下载时才排序并生成，而非每次 rerun 都为全部消息拼接一遍
+                    data=build_report,
                     file_name=f"report_{channel_title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
                     mime="text/plain",
                     width="stretch",
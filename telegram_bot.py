@@ -6,16 +6,22 @@ Bot 仅作为交互前端，实际数据通过 Telethon 用户客户端获取。
 """
 
 import asyncio
+import heapq
 import logging
 import os
 import re
+import time
+from collections import OrderedDict
 from datetime import date
+from operator import itemgetter
 
 from telethon import TelegramClient, events
 from telethon.tl.types import PeerChannel
 
 from analyzer_core import (
-    calc_hotness,
+    assign_hotness,
+    download_photo,
+    download_photo_ref,
     fetch_channel_messages,
     filter_by_date_range,
     get_image_dir,
@@ -31,13 +37,34 @@ log = logging.getLogger(__name__)
 
 cfg = load_config()
 
+# 预取配图时同时在途的下载数上限
+MAX_CONCURRENT_DOWNLOADS = 3
+
+# 同一聊天中相邻两条排行消息的最短发送间隔（秒），对应 Bot 每个聊天约每秒 1 条的限制
+SEND_INTERVAL = 1
+
+# 进度消息两次编辑之间的最短间隔（秒）
+PROGRESS_EDIT_INTERVAL = 2
+
+# 等待用户选择排序方式的会话保留时长（秒）
+PENDING_SESSION_TTL = 300
+
+# 记住的已上传图片条数上限，超出时淘汰最久未使用的条目
+UPLOADED_PHOTOS_MAX = 1000
+
+# 排序选择回复：「1」或「2」，可附带起止日期
+_SORT_CHOICE_RE = re.compile(r'^([12])(?:\s+(\d{4}-\d{2}-\d{2}))?(?:\s+(\d{4}-\d{2}-\d{2}))?$')
+# 频道链接 t.me/xxx 或 @xxx，两种写法合并为一个模式，用户名均在第 1 组
+_CHANNEL_RE = re.compile(r'(?:(?:https?://)?t\.me/|@)([a-zA-Z][\w]{3,})')
+
 
 async def main():
     if not cfg['bot_token']:
         log.error("未配置 bot_token，请在 config.toml [telegram] 段或环境变量 TELEGRAM_BOT_TOKEN 中设置")
         return
 
-    user_client = TelegramClient(cfg['session_name'], cfg['api_id'], cfg['api_hash'], proxy=cfg['proxy'])
+    # 用户客户端只负责拉取数据，不处理更新事件，关闭更新接收以省去其更新循环与差异同步请求
+    user_client = TelegramClient(cfg['session_name'], cfg['api_id'], cfg['api_hash'], proxy=cfg['proxy'], receive_updates=False)
     await user_client.connect()
     if not await user_client.is_user_authorized():
         log.error("用户客户端未授权，请先运行 telegram_channel_selector.py 完成登录")
@@ -48,6 +75,15 @@ async def main():
     await bot.start(bot_token=cfg['bot_token'])
 
     pending_sessions = {}
+    # (channel_id, message_id) → Bot 已上传的图片；再次发送时直接引用服务器端文件，无需重新上传
+    uploaded_photos = OrderedDict()
+
+    def remember_photo(key, photo):
+        """记录 Bot 已上传的图片，按最近使用排序，超出上限时淘汰最久未用的条目。"""
+        uploaded_photos[key] = photo
+        uploaded_photos.move_to_end(key)
+        if len(uploaded_photos) > UPLOADED_PHOTOS_MAX:
+            uploaded_photos.popitem(last=False)
 
     async def send_results(event, session, messages, total, sort_by_hotness):
         entity = session['entity']
@@ -55,10 +91,11 @@ async def main():
         channel_id = session['channel_id']
 
         if sort_by_hotness:
-            sorted_msgs = sorted(messages, key=calc_hotness, reverse=True)[:50]
+            # 每条消息只计算一次热度，排序与标题直接读取 hotness 字段
+            sorted_msgs = heapq.nlargest(50, assign_hotness(messages), key=itemgetter('hotness'))
             sort_label = "热度"
         else:
-            sorted_msgs = sorted(messages, key=lambda x: x['reactions'], reverse=True)[:50]
+            sorted_msgs = heapq.nlargest(50, messages, key=itemgetter('reactions'))
             sort_label = "表情数量"
 
         if not sorted_msgs:
@@ -75,49 +112,131 @@ async def main():
         )
         await event.reply(header)
 
-        chat = await event.get_chat()
-        for idx, msg in enumerate(sorted_msgs, 1):
-            hotness_line = f"🔥 热度: {calc_hotness(msg):.2f}\n" if sort_by_hotness else ""
-            caption = (
-                f"第 {idx} 名\n"
-                f"时间: {msg['date']}\n"
-                f"{hotness_line}"
-                f"目标表情: {msg['reactions']} | 总表情: {msg['total_reactions']}\n"
-                f"浏览: {msg['views']} | 转发: {msg['forwards']}\n"
-                f"内容: {msg['text']}\n"
-                f"链接: {msg['link']}"
-            )
+        chat = session['chat']
 
-            sent = False
-            if msg.get('has_photo'):
+        # 没有 photo_ref（旧缓存）的消息，一次请求取回所有尚无缓存配图的消息对象，而非逐条请求
+        photo_ids = [
+            m['id'] for m in sorted_msgs
+            if m.get('has_photo') and not m.get('photo_ref') and not get_image_path(channel_id, m['id'])
+        ]
+        tg_msgs = {}
+        if photo_ids:
+            try:
+                tg_msgs = {m.id: m for m in await user_client.get_messages(entity, ids=photo_ids) if m}
+            except Exception:
+                pass
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        refetch_task = None
+
+        async def refetch():
+            """file_reference 过期时重新获取消息；同一批抓取的引用通常一起过期，首次过期即一次取回其余全部。"""
+            nonlocal refetch_task
+            if refetch_task is None:
+                # 其余配图可能正在下载，无法从磁盘判断是否还需要，一律包含在内（至多 50 条）
+                ids = [m['id'] for m in sorted_msgs if m.get('photo_ref') and m['id'] not in tg_msgs]
+                refetch_task = asyncio.create_task(user_client.get_messages(entity, ids=ids))
+            for m in await refetch_task:
+                if m:
+                    tg_msgs.setdefault(m.id, m)
+
+        async def fetch_photo(msg):
+            """返回消息配图的本地路径，无法获取时返回 None。"""
+            cached_img = get_image_path(channel_id, msg['id'])
+            if cached_img:
+                return cached_img
+            dest = os.path.join(get_image_dir(channel_id), str(msg['id']))
+            async with semaphore:
                 try:
-                    cached_img = get_image_path(channel_id, msg['id'])
-                    if cached_img:
-                        await bot.send_file(chat, file=cached_img, caption=caption[:1024], force_document=False)
-                        sent = True
-                    else:
-                        tg_msg = await user_client.get_messages(entity, ids=msg['id'])
-                        if tg_msg and tg_msg.photo:
-                            dest = os.path.join(get_image_dir(channel_id), str(msg['id']))
-                            downloaded = await user_client.download_media(tg_msg.photo, file=dest)
-                            if downloaded:
-                                await bot.send_file(chat, file=downloaded, caption=caption[:1024], force_document=False)
-                                sent = True
+                    downloaded = None
+                    if msg.get('photo_ref'):
+                        try:
+                            downloaded = await download_photo_ref(user_client, msg['photo_ref'], dest)
+                        except Exception:
+                            # file_reference 已过期，重新获取消息
+                            await refetch()
+                    tg_msg = tg_msgs.get(msg['id'])
+                    if not downloaded and tg_msg and tg_msg.photo:
+                        downloaded = await download_photo(user_client, tg_msg.photo, dest)
+                    return downloaded
                 except Exception:
-                    pass
+                    return None
 
-            if not sent:
-                await bot.send_message(chat, caption[:4096])
+        # 配图提前并发下载，发送仍按名次顺序进行；发送前一条时后续配图已在下载
+        photo_tasks = [
+            asyncio.create_task(fetch_photo(msg))
+            if msg.get('has_photo') and (channel_id, msg['id']) not in uploaded_photos else None
+            for msg in sorted_msgs
+        ]
 
-            await asyncio.sleep(1)
+        async def send_photo(key, photo, caption):
+            """以图片形式发送一条排行，成功时返回 True。"""
+            try:
+                sent_msg = await bot.send_file(chat, file=photo, caption=caption[:1024], force_document=False)
+            except Exception:
+                return False
+            if sent_msg.photo:
+                remember_photo(key, sent_msg.photo)
+            return True
+
+        next_send = 0.0
+        try:
+            for idx, (msg, photo_task) in enumerate(zip(sorted_msgs, photo_tasks), 1):
+                hotness_line = f"🔥 热度: {msg['hotness']:.2f}\n" if sort_by_hotness else ""
+                caption = (
+                    f"第 {idx} 名\n"
+                    f"时间: {msg['date']}\n"
+                    f"{hotness_line}"
+                    f"目标表情: {msg['reactions']} | 总表情: {msg['total_reactions']}\n"
+                    f"浏览: {msg['views']} | 转发: {msg['forwards']}\n"
+                    f"内容: {msg['text']}\n"
+                    f"链接: {msg['link']}"
+                )
+
+                key = (channel_id, msg['id'])
+                uploaded = uploaded_photos.get(key)
+                if uploaded is not None:
+                    uploaded_photos.move_to_end(key)
+                photo = uploaded
+                if photo is None and photo_task:
+                    photo = await photo_task
+                elif photo is None and msg.get('has_photo'):
+                    # 预取时已上传过、发送前却被其他请求挤出缓存，就地下载
+                    photo = await fetch_photo(msg)
+
+                # 相邻两条的发送开始时间至少相隔 SEND_INTERVAL；上一条的上传与本条配图的等待已计入间隔
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_send = time.monotonic() + SEND_INTERVAL
+
+                sent = bool(photo) and await send_photo(key, photo, caption)
+                if not sent and uploaded is not None:
+                    # 已上传的图片引用失效，丢弃后改为下载原图重新上传，本次排行仍带配图
+                    uploaded_photos.pop(key, None)
+                    photo = await fetch_photo(msg)
+                    sent = bool(photo) and await send_photo(key, photo, caption)
+
+                if not sent:
+                    await bot.send_message(chat, caption[:4096])
+        finally:
+            # 发送中途出错时取消尚未完成的下载
+            for photo_task in photo_tasks:
+                if photo_task:
+                    photo_task.cancel()
 
     @bot.on(events.NewMessage)
     async def handler(event):
         user_id = event.sender_id
         text = (event.message.text or '').strip()
 
+        # 清理超时未选择排序方式的会话，避免用户中途放弃后一直占用内存
+        now = time.monotonic()
+        for expired in [uid for uid, s in pending_sessions.items() if now - s['created_at'] > PENDING_SESSION_TTL]:
+            del pending_sessions[expired]
+
         # 第二步：用户选择排序方式（可附带日期范围） → 加载数据 → 发送结果
-        sort_match = re.match(r'^([12])(?:\s+(\d{4}-\d{2}-\d{2}))?(?:\s+(\d{4}-\d{2}-\d{2}))?$', text)
+        sort_match = _SORT_CHOICE_RE.match(text)
         if sort_match and user_id in pending_sessions:
             sort_choice = sort_match.group(1)
             start_date = date.fromisoformat(sort_match.group(2)) if sort_match.group(2) else None
@@ -128,22 +247,27 @@ async def main():
             title = session['title']
             channel_id = session['channel_id']
 
-            raw_messages, total, fetched_at = load_raw_cache(channel_id)
+            # 缓存解压与解析较慢，放到线程中执行，避免阻塞其他用户的请求
+            raw_messages, total, fetched_at = await asyncio.to_thread(load_raw_cache, channel_id)
             if raw_messages:
                 await event.reply(f"使用缓存数据（{fetched_at}），正在加载「{title}」...")
                 refilter_reactions(raw_messages, cfg['target_emojis'])
                 messages = raw_messages
             else:
                 progress_msg = await event.reply(f"正在分析频道「{title}」… 0%")
+                last_edit = time.monotonic()
 
                 async def on_progress(pct):
-                    nonlocal progress_msg
-                    new_msg = await event.reply(f"正在分析频道「{title}」… {pct}%")
+                    nonlocal last_edit
+                    # 原地编辑进度消息，一次请求且不闪烁；间隔过短的更新直接跳过，避免触发限流
+                    now = time.monotonic()
+                    if now - last_edit < PROGRESS_EDIT_INTERVAL:
+                        return
+                    last_edit = now
                     try:
-                        await progress_msg.delete()
+                        await progress_msg.edit(f"正在分析频道「{title}」… {pct}%")
                     except Exception:
                         pass
-                    progress_msg = new_msg
 
                 try:
                     messages, total = await fetch_channel_messages(
@@ -157,7 +281,7 @@ async def main():
                 except Exception:
                     pass
                 if messages:
-                    save_raw_cache(channel_id, title, messages, total)
+                    await asyncio.to_thread(save_raw_cache, channel_id, title, messages, total)
 
             if not messages:
                 await event.reply(f"频道「{title}」没有找到含表情反应的消息。")
@@ -184,7 +308,7 @@ async def main():
 
         # 方式2：链接或用户名
         if entity is None:
-            m = re.match(r'(?:https?://)?t\.me/([a-zA-Z][\w]{3,})', text) or re.match(r'@([a-zA-Z][\w]{3,})', text)
+            m = _CHANNEL_RE.match(text)
             if m:
                 try:
                     entity = await user_client.get_entity(m.group(1))
@@ -206,6 +330,7 @@ async def main():
 
         pending_sessions[user_id] = {
             'entity': entity, 'title': title, 'channel_id': channel_id,
+            'chat': await event.get_chat(), 'created_at': time.monotonic(),
         }
         await event.reply(
             "请选择排序方式（可附带日期范围）：\n"
@@ -7,7 +7,9 @@ Telegram 频道选择器。
 """
 
 import asyncio
+import re
 from datetime import datetime
+from operator import itemgetter
 from typing import Any
 
 from telethon import TelegramClient
@@ -23,10 +25,14 @@ PROXY = _cfg['proxy']
 PHONE = _cfg['phone']
 CODE = _cfg['code']
 PASSWORD = _cfg['password']
-TARGET_EMOJIS = _cfg['target_emojis']
+# 只做成员判断，集合查找为 O(1)
+TARGET_EMOJIS = frozenset(_cfg['target_emojis'])
 
 # ===================================================================================
 
+# 文件名中除字母数字（\w 与 str.isalnum 一致，另含下划线）、空格和连字符外的字符
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w \-]')
+
 
 async def create_client() -> TelegramClient | None:
     """
@@ -173,32 +179,36 @@ async def analyze_channel(client: TelegramClient, channel: dict[str, Any]) -> No
     total_checked = 0
 
     print("⏳ 正在获取消息...")
-    async for message in client.iter_messages(entity, limit=None):
+    async for message in client.iter_messages(entity, limit=None, wait_time=0):
         total_checked += 1
 
-        reaction_count = 0
-        if message.reactions:
-            for reaction in message.reactions.results:
-                if hasattr(reaction.reaction, 'emoticon'):
-                    emoji = reaction.reaction.emoticon
-                    if emoji in TARGET_EMOJIS:
-                        reaction_count += reaction.count
-
-        if reaction_count > 0 or message.reactions:
-            messages_with_reactions.append({
-                'id': message.id,
-                'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                'text': message.text[:100] + '...' if message.text and len(message.text) > 100 else (message.text or '[无文字内容]'),
-                'views': message.views or 0,
-                'forwards': message.forwards or 0,
-                'reactions': reaction_count,
-                'total_reactions': sum(r.count for r in message.reactions.results) if message.reactions else 0,
-                'link': f"https://t.me/{entity.username}/{message.id}" if hasattr(entity, 'username') and entity.username else f"[频道ID: {entity.id}]"
-            })
-
         if total_checked % 100 == 0:
             print(f"   已检查 {total_checked} 条消息...", end='\r')
 
+        # 没有任何表情的消息占多数，直接跳过
+        if not message.reactions:
+            continue
+
+        # 单次遍历同时统计目标表情数和总数
+        reaction_count = 0
+        total_reactions = 0
+        for reaction in message.reactions.results:
+            count = reaction.count
+            total_reactions += count
+            if getattr(reaction.reaction, 'emoticon', None) in TARGET_EMOJIS:
+                reaction_count += count
+
+        messages_with_reactions.append({
+            'id': message.id,
+            'date': message.date.isoformat(' ', 'seconds')[:19],
+            'text': message.text[:100] + '...' if message.text and len(message.text) > 100 else (message.text or '[无文字内容]'),
+            'views': message.views or 0,
+            'forwards': message.forwards or 0,
+            'reactions': reaction_count,
+            'total_reactions': total_reactions,
+            'link': f"https://t.me/{entity.username}/{message.id}" if hasattr(entity, 'username') and entity.username else f"[频道ID: {entity.id}]"
+        })
+
     print(f"\n✅ 共检查 {total_checked} 条消息，找到 {len(messages_with_reactions)} 条有表情的消息")
 
     # 显示结果并导出
@@ -229,7 +239,8 @@ def display_results(messages: list[dict[str, Any]], channel_title: str, top_n: i
         print("\n❌ 未找到任何有表情的消息")
         return []
 
-    sorted_messages = sorted(messages, key=lambda x: x['reactions'], reverse=True)
+    # 返回值供导出完整报告，仍需全量排序
+    sorted_messages = sorted(messages, key=itemgetter('reactions'), reverse=True)
 
     print("\n" + "=" * 80)
     print(f"📊 频道 [{channel_title}] 排序结果（按 ❤️👍 表情数量，显示前 {top_n} 条）")
@@ -278,7 +289,7 @@ def export_to_file(messages: list[dict[str, Any]], channel_title: str) -> str |
         return None
 
     # 生成安全的文件名
-    safe_title = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in channel_title)
+    safe_title = _UNSAFE_FILENAME_RE.sub('_', channel_title)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"report_{safe_title}_{timestamp}.txt"
 
@@ -7,7 +7,9 @@ Telegram 频道消息表情统计工具。
 """
 
 import asyncio
+import heapq
 from datetime import datetime
+from operator import itemgetter
 from typing import Any
 
 from telethon import TelegramClient
@@ -26,7 +28,8 @@ PASSWORD = _cfg['password']
 CHANNEL = _cfg['channel']
 START_DATE = _cfg['start_date']
 END_DATE = _cfg['end_date']
-TARGET_EMOJIS = _cfg['target_emojis']
+# 只做成员判断，集合查找为 O(1)
+TARGET_EMOJIS = frozenset(_cfg['target_emojis'])
 
 # =================================================
 
@@ -112,34 +115,39 @@ async def get_messages_with_reactions() -> list[dict[str, Any]]:
     print("\n⏳ 正在获取消息...")
     async for message in client.iter_messages(
         channel,
-        limit=None  # 不限制数量，获取所有历史消息
+        limit=None,  # 不限制数量，获取所有历史消息
+        wait_time=0,  # 不在每页之间固定休眠，遇到限流时由 telethon 按 FloodWait 自动等待
     ):
         total_checked += 1
 
-        # 统计目标表情数量
-        reaction_count = 0
-        if message.reactions:
-            for reaction in message.reactions.results:
-                if hasattr(reaction.reaction, 'emoticon'):
-                    emoji = reaction.reaction.emoticon
-                    if emoji in TARGET_EMOJIS:
-                        reaction_count += reaction.count
-
-        if reaction_count > 0 or message.reactions:
-            messages_with_reactions.append({
-                'id': message.id,
-                'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                'text': message.text[:100] + '...' if message.text and len(message.text) > 100 else (message.text or '[无文字内容]'),
-                'views': message.views or 0,
-                'forwards': message.forwards or 0,
-                'reactions': reaction_count,
-                'total_reactions': sum(r.count for r in message.reactions.results) if message.reactions else 0,
-                'link': f"https://t.me/{channel.username}/{message.id}" if hasattr(channel, 'username') and channel.username else f"[频道ID: {channel.id}]"
-            })
-
         if total_checked % 100 == 0:
             print(f"   已检查 {total_checked} 条消息...", end='\r')
 
+        # 没有任何表情的消息占多数，直接跳过
+        if not message.reactions:
+            continue
+
+        # 单次遍历同时统计目标表情数和总数
+        reaction_count = 0
+        total_reactions = 0
+        for reaction in message.reactions.results:
+            count = reaction.count
+            total_reactions += count
+            if getattr(reaction.reaction, 'emoticon', None) in TARGET_EMOJIS:
+                reaction_count += count
+
+        messages_with_reactions.append({
+            'id': message.id,
+            # Telegram 时间不含微秒，isoformat 截取结果与 strftime 一致且快约 2 倍
+            'date': message.date.isoformat(' ', 'seconds')[:19],
+            'text': message.text[:100] + '...' if message.text and len(message.text) > 100 else (message.text or '[无文字内容]'),
+            'views': message.views or 0,
+            'forwards': message.forwards or 0,
+            'reactions': reaction_count,
+            'total_reactions': total_reactions,
+            'link': f"https://t.me/{channel.username}/{message.id}" if hasattr(channel, 'username') and channel.username else f"[频道ID: {channel.id}]"
+        })
+
     print(f"\n✅ 共检查 {total_checked} 条消息，找到 {len(messages_with_reactions)} 条有表情的消息")
 
     await client.disconnect()
@@ -167,14 +175,13 @@ def sort_and_display(messages: list[dict[str, Any]], top_n: int = 10) -> list[di
         print("\n❌ 未找到任何消息")
         return []
     
-    # 按目标表情数量降序排序
-    sorted_messages = sorted(messages, key=lambda x: x['reactions'], reverse=True)
+    # 只显示前 N 条，按目标表情数量取最大的 N 条即可，无需全量排序
+    top_messages = heapq.nlargest(top_n, messages, key=itemgetter('reactions'))
     
     print("\n" + "=" * 80)
     print(f"📊 排序结果（按 ❤️👍 表情数量从高到低，显示前 {top_n} 条）")
     print("=" * 80)
     
-    top_messages = sorted_messages[:top_n]
     for idx, msg in enumerate(top_messages, 1):
         print(f"\n🏆 第 {idx} 名")
         print(f"   📅 时间: {msg['date']}")
@@ -208,7 +215,7 @@ async def export_to_file(messages: list[dict[str, Any]], filename: str = 'telegr
     filename : str, 默认 ``'telegram_reactions_report.txt'``
         输出文件路径。
     """
-    sorted_messages = sorted(messages, key=lambda x: x['reactions'], reverse=True)
+    sorted_messages = sorted(messages, key=itemgetter('reactions'), reverse=True)
     
     with open(filename, 'w', encoding='utf-8') as f:
         f.write("Telegram 频道表情统计报告\n")
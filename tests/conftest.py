@@ -0,0 +1,29 @@
+"""测试共享夹具。"""
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def sample_message():
+    """
+    一条字段齐全的典型消息，整个测试会话只构造一次。
+
+    reactions 为默认目标表情（❤️ 👍 🔥）之和 42，total_reactions 为全部表情之和 50。
+    """
+    return {
+        'id': 1,
+        'date': '2026-01-15 12:00:00',
+        'text': 'Test message',
+        'views': 100,
+        'forwards': 5,
+        'reactions': 42,
+        'total_reactions': 50,
+        'link': 'https://t.me/test/1',
+        'reaction_details': {'❤️': 10, '👍': 5, '🔥': 27, '😁': 8},
+    }
+
+
+@pytest.fixture
+def messages(sample_message):
+    """浅拷贝 sample_message，测试改写 reactions 等字段时互不影响。"""
+    return [dict(sample_message)]
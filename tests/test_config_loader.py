@@ -3,7 +3,13 @@
 import os
 from unittest import mock
 
-from config_loader import ALL_EMOJIS, DEFAULT_TARGET_EMOJIS, load_config
+from config_loader import (
+    ALL_EMOJIS,
+    ALL_EMOJIS_SET,
+    DEFAULT_TARGET_EMOJIS,
+    DEFAULT_TARGET_EMOJIS_SET,
+    load_config,
+)
 
 
 def test_default_target_emojis_is_nonempty_list():
@@ -28,9 +34,14 @@ def test_all_emojis_is_nonempty_list():
 
 def test_default_target_emojis_is_subset_of_all():
     """DEFAULT_TARGET_EMOJIS 应为 ALL_EMOJIS 的子集。"""
-    all_set = set(ALL_EMOJIS)
-    for emoji in DEFAULT_TARGET_EMOJIS:
-        assert emoji in all_set, f"{emoji!r} 在 DEFAULT_TARGET_EMOJIS 中但不在 ALL_EMOJIS 中"
+    missing = DEFAULT_TARGET_EMOJIS_SET - ALL_EMOJIS_SET
+    assert not missing, f"{sorted(missing)!r} 在 DEFAULT_TARGET_EMOJIS 中但不在 ALL_EMOJIS 中"
+
+
+def test_emoji_sets_match_lists():
+    """集合形式应与对应列表包含相同的表情。"""
+    assert ALL_EMOJIS_SET == frozenset(ALL_EMOJIS)
+    assert DEFAULT_TARGET_EMOJIS_SET == frozenset(DEFAULT_TARGET_EMOJIS)
 
 
 def test_load_config_returns_expected_keys():
@@ -41,7 +52,7 @@ def test_load_config_returns_expected_keys():
         'phone', 'code', 'password', 'channel',
         'start_date', 'end_date', 'target_emojis', 'bot_token',
     }
-    assert set(cfg.keys()) == expected_keys
+    assert cfg.keys() == expected_keys
 
 
 def test_load_config_target_emojis_default():
@@ -68,3 +79,15 @@ def test_load_config_target_emojis_env_override():
     with mock.patch.dict(os.environ, {'TARGET_EMOJIS': '❤️,👍,🔥'}):
         cfg = load_config()
         assert cfg['target_emojis'] == ['❤️', '👍', '🔥']
+
+
+def test_load_config_reparses_changed_toml(tmp_path):
+    """config.toml 内容变更后 load_config() 应返回新值。"""
+    config_path = tmp_path / 'config.toml'
+    config_path.write_text('[auth]\nphone = "+100"\n', encoding='utf-8')
+    with mock.patch('config_loader._CONFIG_PATH', str(config_path)), \
+            mock.patch.dict(os.environ, {'TELEGRAM_PHONE': ''}):
+        assert load_config()['phone'] == '+100'
+        config_path.write_text('[auth]\nphone = "+200"\n', encoding='utf-8')
+        os.utime(config_path, ns=(0, config_path.stat().st_mtime_ns + 1_000_000))
+        assert load_config()['phone'] == '+200'
@@ -1,23 +1,37 @@
 """工具函数测试。"""
 
-from analyzer_core import refilter_reactions
+import asyncio
+import contextlib
+import json
+import os
+from datetime import UTC, date, datetime
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from analyzer_core import (
+    _read_raw_journal,
+    assign_hotness,
+    atomic_open,
+    calc_hotness,
+    download_photo,
+    fetch_channel_messages,
+    filter_by_date_range,
+    format_top_messages,
+    get_image_path,
+    iter_channel_messages,
+    load_image_index,
+    load_raw_cache,
+    refilter_reactions,
+    save_raw_cache,
+)
+from config_loader import DEFAULT_TARGET_EMOJIS
 from streamlit_app import generate_report
 
 
-def test_generate_report_basic():
+def test_generate_report_basic(messages):
     """generate_report 应生成包含关键信息的字符串。"""
-    messages = [
-        {
-            'id': 1,
-            'date': '2026-01-15 12:00:00',
-            'text': 'Test message',
-            'views': 100,
-            'forwards': 5,
-            'reactions': 42,
-            'total_reactions': 50,
-            'link': 'https://t.me/test/1',
-        }
-    ]
     report = generate_report(messages, 'Test Channel')
 
     assert isinstance(report, str)
@@ -27,39 +41,316 @@ def test_generate_report_basic():
     assert '42' in report
 
 
-def test_refilter_reactions_basic():
+def test_sample_message_is_consistent(messages):
+    """共享样例消息的计数应自洽：目标表情数不超过总数，明细之和等于总数。"""
+    msg = messages[0]
+    assert sum(msg['reaction_details'].values()) == msg['total_reactions']
+    assert msg['reactions'] <= msg['total_reactions']
+    refilter_reactions(messages, DEFAULT_TARGET_EMOJIS)
+    assert msg['reactions'] == 42
+
+
+def test_refilter_reactions_basic(messages):
     """refilter_reactions 应根据目标表情重新计算 reactions。"""
-    messages = [
-        {
-            'id': 1,
-            'reactions': 0,
-            'reaction_details': {'❤️': 10, '👍': 5, '🔥': 3},
-        },
-    ]
     refilter_reactions(messages, ['❤️', '👍'])
     assert messages[0]['reactions'] == 15
 
 
-def test_refilter_reactions_empty_target():
+def test_refilter_reactions_empty_target(messages):
     """目标表情为空时 reactions 应为 0。"""
-    messages = [
-        {
-            'id': 1,
-            'reactions': 99,
-            'reaction_details': {'❤️': 10, '👍': 5},
-        },
-    ]
     refilter_reactions(messages, [])
     assert messages[0]['reactions'] == 0
 
 
-def test_refilter_reactions_old_cache_preserved():
+def test_refilter_reactions_old_cache_preserved(messages):
     """缺少 reaction_details 的旧缓存消息应保留原有 reactions 值。"""
-    messages = [
-        {
-            'id': 1,
-            'reactions': 42,
-        },
-    ]
+    del messages[0]['reaction_details']
     refilter_reactions(messages, ['❤️', '👍'])
     assert messages[0]['reactions'] == 42
+
+
+def test_refilter_reactions_empty_target_keeps_old_cache():
+    """目标表情为空时，旧缓存消息同样保留原有 reactions 值。"""
+    messages = [
+        {'id': 1, 'reactions': 42},
+        {'id': 2, 'reactions': 7, 'reaction_details': {'❤️': 7}},
+    ]
+    refilter_reactions(messages, [])
+    assert [m['reactions'] for m in messages] == [42, 0]
+
+
+def test_calc_hotness_basic():
+    """calc_hotness 应按 log10(得分) + 天数/800 计算热度。"""
+    msg = {'reactions': 0, 'forwards': 0, 'date': '2022-03-11 00:00:00'}
+    assert calc_hotness(msg) == pytest.approx(1.0)
+
+    msg = {'reactions': 100, 'forwards': 100, 'date': '2020-01-01 00:00:00'}
+    assert calc_hotness(msg) == pytest.approx(2.0)
+
+
+def test_calc_hotness_timestamp_matches_date():
+    """有 timestamp 字段时计算结果应与解析日期字符串一致。"""
+    msg = {'reactions': 7, 'forwards': 3, 'date': '2025-06-30 08:15:00'}
+    with_ts = dict(msg, timestamp=1751271300)
+    assert calc_hotness(with_ts) == pytest.approx(calc_hotness(msg))
+
+
+def test_assign_hotness_follows_refilter():
+    """重新筛选表情后再次计算的 hotness 应反映新的 reactions。"""
+    messages = [{'reactions': 0, 'forwards': 0, 'date': '2020-01-01 00:00:00', 'reaction_details': {'❤️': 100}}]
+    assign_hotness(messages)
+    assert messages[0]['hotness'] == pytest.approx(0.0)
+    assign_hotness(refilter_reactions(messages, ['❤️']))
+    assert messages[0]['hotness'] == pytest.approx(calc_hotness(messages[0]))
+    assert messages[0]['hotness'] > 1
+
+
+def test_filter_by_date_range_inclusive():
+    """日期范围过滤应包含起止两天。"""
+    messages = [
+        {'id': 1, 'date': '2026-01-01 00:00:00'},
+        {'id': 2, 'date': '2026-01-15 12:00:00'},
+        {'id': 3, 'date': '2026-01-31 23:59:59'},
+        {'id': 4, 'date': '2026-02-01 00:00:00'},
+    ]
+    result = filter_by_date_range(messages, date(2026, 1, 15), date(2026, 1, 31))
+    assert [m['id'] for m in result] == [2, 3]
+    assert [m['id'] for m in filter_by_date_range(messages, None, date(2026, 1, 1))] == [1]
+    assert filter_by_date_range(messages, None, None) is messages
+
+
+def test_raw_cache_roundtrip(tmp_path):
+    """save_raw_cache 写入的缓存应能被 load_raw_cache 原样读回。"""
+    messages = [
+        {'id': 1, 'date': '2026-01-15 12:00:00', 'reactions': 3, 'reaction_details': {'❤️': 3}},
+        {'id': 2, 'date': '2026-01-16 12:00:00', 'reactions': 0, 'reaction_details': {}},
+    ]
+    path = str(tmp_path / 'raw_1.json.gz')
+    with mock.patch('analyzer_core.get_raw_cache_path', return_value=path):
+        save_raw_cache(1, 'Test Channel', messages, 10)
+        loaded, total_checked, fetched_at = load_raw_cache(1)
+    assert loaded == messages
+    assert total_checked == 10
+    assert fetched_at
+
+
+def test_raw_cache_legacy_format(tmp_path):
+    """旧版未压缩、逐条存储的缓存应仍可读取。"""
+    messages = [{'id': 1, 'reactions': 42}]
+    legacy = tmp_path / 'raw_1.json'
+    legacy.write_text(json.dumps({'messages': messages, 'total_checked': 5, 'fetched_at': 'x'}), encoding='utf-8')
+    with mock.patch('analyzer_core.get_raw_cache_path', return_value=os.fspath(legacy) + '.gz'):
+        assert load_raw_cache(1) == (messages, 5, 'x')
+
+
+def test_format_top_messages_order():
+    """按 reactions 降序取前 N 条，并列时保持原有顺序。"""
+    messages = [
+        {'id': i, 'reactions': r, 'views': 0, 'text': f'm{i}', 'link': f'l{i}'}
+        for i, r in enumerate([5, 9, 5, 1, 9])
+    ]
+    text = format_top_messages(messages, 'Chan', top_n=3)
+    assert 'Top 3' in text
+    assert text.index('m1') < text.index('m4') < text.index('m0')
+    assert 'm2' not in text
+
+
+def test_atomic_open_keeps_old_file_on_failure(tmp_path):
+    """写入中途出错时应保留原文件且不留下临时文件。"""
+    path = tmp_path / 'channel_1.json'
+    path.write_bytes(b'old')
+    with pytest.raises(RuntimeError), atomic_open(str(path)) as f:
+        f.write(b'partial')
+        raise RuntimeError
+    assert path.read_bytes() == b'old'
+    with atomic_open(str(path)) as f:
+        f.write(b'new')
+    assert path.read_bytes() == b'new'
+    assert os.listdir(tmp_path) == ['channel_1.json']
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Windows 不区分这些权限位')
+def test_atomic_open_uses_regular_file_mode(tmp_path):
+    """新文件按 umask 取默认权限，替换已有文件时沿用其权限，而非 mkstemp 的 0600。"""
+    path = tmp_path / 'channel_1.json'
+    with mock.patch('analyzer_core._UMASK', 0o022), atomic_open(str(path)) as f:
+        f.write(b'new')
+    assert path.stat().st_mode & 0o777 == 0o644
+    path.chmod(0o640)
+    with atomic_open(str(path)) as f:
+        f.write(b'newer')
+    assert path.stat().st_mode & 0o777 == 0o640
+
+
+def test_raw_journal_keeps_messages_before_checkpoint(tmp_path):
+    """只返回最后一个检查点之前的消息，其后的内容与写到一半的行被丢弃。"""
+    journal = tmp_path / 'raw_1.partial.ndjson'
+    journal.write_bytes(
+        b'{"id":9,"reactions":1}\n{"id":7,"reactions":5}\n'
+        b'{"checkpoint":6,"total_checked":4}\n'
+        b'{"id":5,"reactions":2}\n{"id":3,"rea'
+    )
+    messages, checkpoint, end = _read_raw_journal(str(journal))
+    assert messages == [{'id': 9, 'reactions': 1}, {'id': 7, 'reactions': 5}]
+    assert checkpoint == {'checkpoint': 6, 'total_checked': 4}
+    assert journal.read_bytes()[:end].endswith(b'"total_checked":4}\n')
+
+
+def test_download_photo_writes_complete_file_only(tmp_path):
+    """下载过程中目标图片不存在，完成后才出现；失败时不留下任何文件。"""
+    dest = tmp_path / '7.jpg'
+
+    class _Client:
+        async def download_media(self, photo, file):
+            with open(file, 'wb') as f:
+                f.write(b'half')
+                assert not dest.exists()
+                if photo == 'broken':
+                    raise ConnectionError
+                f.write(b'-done')
+            return file
+
+    assert asyncio.run(download_photo(_Client(), 'ok', str(tmp_path / '7'))) == str(dest)
+    assert dest.read_bytes() == b'half-done'
+    dest.unlink()
+    with pytest.raises(ConnectionError):
+        asyncio.run(download_photo(_Client(), 'broken', str(tmp_path / '7')))
+    assert os.listdir(tmp_path) == []
+
+
+def test_get_image_path_finds_file_added_without_mtime_change(tmp_path):
+    """目录 mtime 未变化时，索引之后新增的图片仍应能找到。"""
+    img_dir = tmp_path / 'images' / '1'
+    img_dir.mkdir(parents=True)
+    (img_dir / '3.jpg').write_bytes(b'x')
+    with mock.patch('analyzer_core._CACHE_DIR', str(tmp_path)):
+        assert get_image_path(1, 3) == str(img_dir / '3.jpg')
+        mtime_ns = os.stat(img_dir).st_mtime_ns
+        (img_dir / '5.jpg').write_bytes(b'y')
+        os.utime(img_dir, ns=(mtime_ns, mtime_ns))
+        assert get_image_path(1, 5) == str(img_dir / '5.jpg')
+        assert get_image_path(1, 6) is None
+        # 批量校验使用的快照每次重新扫描，同样包含新增图片
+        assert load_image_index(1) == {3: str(img_dir / '3.jpg'), 5: str(img_dir / '5.jpg')}
+        assert load_image_index(2) == {}
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_raw_journal_tolerates_torn_multibyte_line(tmp_path, use_orjson):
+    """最后一行截断在多字节字符中间时，应与其他写到一半的行一样被丢弃。"""
+    journal = tmp_path / 'raw_1.partial.ndjson'
+    # 去掉末尾 8 个字节后，最后一行恰好停在「中」的第一个字节之后
+    journal.write_bytes(
+        '{"id":9,"text":"中文"}\n{"checkpoint":9,"total_checked":1}\n{"id":8,"text":"中文"}\n'.encode()[:-8]
+    )
+    patch = mock.patch('analyzer_core.orjson', None) if not use_orjson else contextlib.nullcontext()
+    with patch:
+        messages, checkpoint, _ = _read_raw_journal(str(journal))
+    assert messages == [{'id': 9, 'text': '中文'}]
+    assert checkpoint == {'checkpoint': 9, 'total_checked': 1}
+
+
+def _make_message(message_id):
+    """构造一条 Telethon 消息替身，偶数 id 带有 ❤️ 反应。"""
+    reactions = None
+    if message_id % 2 == 0:
+        reactions = SimpleNamespace(results=[SimpleNamespace(reaction=SimpleNamespace(emoticon='❤️'), count=message_id)])
+    return SimpleNamespace(
+        id=message_id, date=datetime(2024, 1, 1, tzinfo=UTC), text='hi', views=1, forwards=0,
+        reactions=reactions, photo=None,
+    )
+
+
+class _FakeClient:
+    """按 id 存储消息的最小 Telegram 客户端替身，可在返回若干条后模拟断线。"""
+
+    def __init__(self, ids, fail_after=None):
+        self.messages = {i: _make_message(i) for i in ids}
+        self.fail_after = fail_after
+
+    async def get_messages(self, entity, limit=None, ids=None):
+        if ids is not None:
+            return [self.messages.get(i) for i in ids]
+        return sorted(self.messages.values(), key=lambda m: -m.id)[:limit]
+
+    async def iter_messages(self, entity, limit=None, offset_id=0, min_id=0, wait_time=None):
+        for n, message in enumerate(sorted(self.messages.values(), key=lambda m: -m.id)):
+            if n == self.fail_after:
+                raise ConnectionError
+            if (not offset_id or message.id < offset_id) and message.id > min_id:
+                # 交出控制权，让并发的抓取有机会交替执行
+                await asyncio.sleep(0)
+                yield message
+
+
+async def _collect_ids(client):
+    return [m.id async for m in iter_channel_messages(client, None)]
+
+
+@pytest.mark.parametrize('max_id', [0, 120, 12345])
+def test_iter_channel_messages_newest_first(max_id):
+    """顺序翻页与按 id 并发拉取都应从新到旧返回全部现存消息。"""
+    ids = [i for i in range(1, max_id + 1) if i % 7]
+    assert asyncio.run(_collect_ids(_FakeClient(ids))) == sorted(ids, reverse=True)
+
+
+def test_fetch_channel_messages_resumes_from_checkpoint(tmp_path):
+    """中断后再次抓取应从检查点继续，结果与一次完整抓取一致。"""
+    entity = SimpleNamespace(id=1, username='chan')
+    ids = range(1, 1001)
+    with mock.patch('analyzer_core._CACHE_DIR', str(tmp_path)), \
+            mock.patch('analyzer_core.get_raw_journal_path', return_value=str(tmp_path / 'journal')), \
+            mock.patch('analyzer_core._JOURNAL_CHECKPOINT_EVERY', 100):
+        expected = asyncio.run(fetch_channel_messages(_FakeClient(ids), entity, resume=False))
+        with pytest.raises(ConnectionError):
+            asyncio.run(fetch_channel_messages(_FakeClient(ids, fail_after=450), entity, resume=False))
+        checkpoint = _read_raw_journal(str(tmp_path / 'journal'))[1]
+        assert (checkpoint['checkpoint'], checkpoint['total_checked'], checkpoint['newest_id']) == (602, 399, 1000)
+        assert asyncio.run(fetch_channel_messages(_FakeClient(ids), entity)) == expected
+        # 抓取完成后日志即被删除
+        assert not (tmp_path / 'journal').exists()
+
+
+def test_fetch_channel_messages_resume_fetches_newer_messages(tmp_path):
+    """续抓时应补抓中断后新发布的消息；过旧的日志则被丢弃并重新抓取。"""
+    entity = SimpleNamespace(id=1, username='chan')
+    with mock.patch('analyzer_core._CACHE_DIR', str(tmp_path)), \
+            mock.patch('analyzer_core.get_raw_journal_path', return_value=str(tmp_path / 'journal')), \
+            mock.patch('analyzer_core._JOURNAL_CHECKPOINT_EVERY', 100):
+        expected, expected_total = asyncio.run(fetch_channel_messages(_FakeClient(range(1, 1101)), entity, resume=False))
+        for max_age in (3600, -1):
+            with pytest.raises(ConnectionError):
+                asyncio.run(fetch_channel_messages(_FakeClient(range(1, 1001), fail_after=450), entity, resume=False))
+            with mock.patch('analyzer_core._JOURNAL_MAX_AGE', max_age):
+                messages, total = asyncio.run(fetch_channel_messages(_FakeClient(range(1, 1101)), entity))
+            assert sorted(messages, key=lambda m: -m['id']) == expected
+            assert total == expected_total
+
+
+def test_fetch_channel_messages_serializes_same_channel(tmp_path):
+    """同一频道的并发抓取依次执行，互不破坏对方的抓取日志。"""
+    entity = SimpleNamespace(id=1, username='chan')
+    ids = range(1, 301)
+    active = []
+    peak = 0
+
+    class _TrackedClient(_FakeClient):
+        async def iter_messages(self, *args, **kwargs):
+            nonlocal peak
+            active.append(self)
+            peak = max(peak, len(active))
+            async for message in super().iter_messages(*args, **kwargs):
+                yield message
+            active.remove(self)
+
+    async def fetch_twice():
+        return await asyncio.gather(*(fetch_channel_messages(_TrackedClient(ids), entity) for _ in range(2)))
+
+    with mock.patch('analyzer_core._CACHE_DIR', str(tmp_path)), \
+            mock.patch('analyzer_core.get_raw_journal_path', return_value=str(tmp_path / 'journal')), \
+            mock.patch('analyzer_core._JOURNAL_CHECKPOINT_EVERY', 100):
+        first, second = asyncio.run(fetch_twice())
+    assert peak == 1
+    assert first == second
+    assert first[1] == 300
+    assert not (tmp_path / 'journal').exists()